@@ -10,10 +10,42 @@ import logging
 import os
 import re
 from typing import Optional
-from urllib.parse import parse_qs, quote_plus, urlencode, urlparse, urlunparse
+from urllib.parse import quote_plus, urlparse
 
 logger = logging.getLogger(__name__)
 
+# Query values made only of these characters need no percent-encoding; the
+# static tracking params and typical affiliate IDs all match
+_URL_SAFE_VALUE = re.compile(r"[A-Za-z0-9_.~-]+")
+
+# Affiliate partner configuration:
+# {"domain": ("affiliate ID param", "ID env var name", {static params})}
+_AFFILIATE_PARTNERS = {
+    "viator.com": ("aid", "VIATOR_AFFILIATE_ID", {"mcid": "cruise-planner-app"}),
+    "getyourguide.com": (
+        "partner_id",
+        "GETYOURGUIDE_AFFILIATE_ID",
+        {"utm_source": "cruise-planner", "utm_medium": "affiliate"},
+    ),
+    "klook.com": ("affiliate_id", "KLOOK_AFFILIATE_ID", {"source": "cruise-planner"}),
+    "tripadvisor.com": (
+        "pid",
+        "TRIPADVISOR_AFFILIATE_ID",
+        {"source": "cruise-planner"},
+    ),
+    "booking.com": (
+        "aid",
+        "BOOKING_AFFILIATE_ID",
+        {"label": "cruise-planner-booking"},
+    ),
+}
+
+# Matches a partner domain or any of its subdomains in a single pass, capturing
+# the partner domain; anchored so look-alikes such as notviator.com don't match
+_PARTNER_DOMAIN_RE = re.compile(
+    r"(?:^|\.)(" + "|".join(map(re.escape, _AFFILIATE_PARTNERS)) + r")\Z"
+)
+
 
 def get_affiliate_config(domain: str) -> Optional[dict]:
     """
@@ -28,38 +60,13 @@ def get_affiliate_config(domain: str) -> Optional[dict]:
     Returns:
         Dictionary of affiliate parameters if configured, None otherwise
     """
-    # Affiliate partner configuration
-    # Format: {"domain": {"param_name": "param_value" or env_var_name}}
-    affiliate_partners = {
-        "viator.com": {
-            "aid": os.environ.get("VIATOR_AFFILIATE_ID", ""),
-            "mcid": "cruise-planner-app",
-        },
-        "getyourguide.com": {
-            "partner_id": os.environ.get("GETYOURGUIDE_AFFILIATE_ID", ""),
-            "utm_source": "cruise-planner",
-            "utm_medium": "affiliate",
-        },
-        "klook.com": {
-            "affiliate_id": os.environ.get("KLOOK_AFFILIATE_ID", ""),
-            "source": "cruise-planner",
-        },
-        "tripadvisor.com": {
-            "pid": os.environ.get("TRIPADVISOR_AFFILIATE_ID", ""),
-            "source": "cruise-planner",
-        },
-        "booking.com": {
-            "aid": os.environ.get("BOOKING_AFFILIATE_ID", ""),
-            "label": "cruise-planner-booking",
-        },
-    }
-
-    # Check if domain is in partners (exact match or ends with partner domain)
-    for partner_domain, config in affiliate_partners.items():
-        if domain == partner_domain or domain.endswith("." + partner_domain):
-            return config
+    # Check if domain is a partner (exact match or subdomain of a partner domain)
+    match = _PARTNER_DOMAIN_RE.search(domain)
+    if not match:
+        return None
 
-    return None
+    id_param, env_var, static_params = _AFFILIATE_PARTNERS[match.group(1)]
+    return {id_param: os.environ.get(env_var, ""), **static_params}
 
 
 def get_domain_from_url(url: str) -> Optional[str]:
@@ -91,6 +98,13 @@ def get_domain_from_url(url: str) -> Optional[str]:
         return None
 
 
+def _encode_query_value(value: str) -> str:
+    """Encode a query value, skipping quote_plus when it is already URL-safe."""
+    if _URL_SAFE_VALUE.fullmatch(value):
+        return value
+    return quote_plus(value)
+
+
 def add_affiliate_params(url: str) -> str:
     """
     Add affiliate tracking parameters to a booking URL if the domain is supported.
@@ -127,32 +141,29 @@ def add_affiliate_params(url: str) -> str:
         return url
 
     try:
-        # Parse the URL
-        parsed = urlparse(url)
-        query_params = parse_qs(parsed.query, keep_blank_values=True)
+        # Append the affiliate params to the URL as-is instead of parsing and
+        # re-encoding its whole query string; the fragment stays at the end
+        head, hash_mark, fragment = url.partition("#")
+        query = head.partition("?")[2]
+        existing_keys = {pair.partition("=")[0] for pair in query.split("&")}
 
-        # Flatten query params (parse_qs returns lists)
-        flat_params = {
-            k: v[0] if isinstance(v, list) else v for k, v in query_params.items()
+        # Add affiliate parameters (don't override existing params)
+        new_params = {
+            key: value
+            for key, value in active_params.items()
+            if key not in existing_keys
         }
+        if not new_params:
+            return url
 
-        # Add affiliate parameters (don't override existing params)
-        for key, value in active_params.items():
-            if key not in flat_params:
-                flat_params[key] = value
-
-        # Rebuild URL with affiliate params
-        new_query = urlencode(flat_params)
-        affiliate_url = urlunparse(
-            (
-                parsed.scheme,
-                parsed.netloc,
-                parsed.path,
-                parsed.params,
-                new_query,
-                parsed.fragment,
-            )
+        if head.endswith(("?", "&")):
+            separator = ""
+        else:
+            separator = "&" if "?" in head else "?"
+        new_query = "&".join(
+            f"{key}={_encode_query_value(value)}" for key, value in new_params.items()
         )
+        affiliate_url = f"{head}{separator}{new_query}{hash_mark}{fragment}"
 
         logger.info(f"Added affiliate params to {domain} URL")
         return affiliate_url
@@ -192,11 +203,7 @@ PLATFORM_PRIORITY = [
 
 # Maps each domain to its primary affiliate ID environment variable name
 AFFILIATE_ENV_VARS = {
-    "viator.com": "VIATOR_AFFILIATE_ID",
-    "getyourguide.com": "GETYOURGUIDE_AFFILIATE_ID",
-    "klook.com": "KLOOK_AFFILIATE_ID",
-    "tripadvisor.com": "TRIPADVISOR_AFFILIATE_ID",
-    "booking.com": "BOOKING_AFFILIATE_ID",
+    domain: env_var for domain, (_, env_var, _) in _AFFILIATE_PARTNERS.items()
 }
 
 
@@ -356,29 +363,32 @@ def process_plan_activities(activities: list, port_name: str = "") -> list:
         return activities
 
     configured_platforms = get_configured_platforms()
+    # Fallback search URLs need a port name and at least one configured platform
+    platform_count = len(configured_platforms) if port_name else 0
 
     processed_activities = []
     for idx, activity in enumerate(activities):
-        # Create a copy to avoid modifying the original
-        processed_activity = activity.copy()
-
-        ai_url = processed_activity.get("booking_url")
+        ai_url = activity.get("booking_url")
+        booking_url = ai_url
 
         if ai_url and validate_booking_url(ai_url):
             # AI provided a valid product-page URL — add affiliate params
-            processed_activity["booking_url"] = add_affiliate_params(ai_url)
+            booking_url = add_affiliate_params(ai_url)
         else:
             # Fallback: generate a search URL with round-robin distribution
-            search_term = processed_activity.get(
-                "booking_search_term", ""
-            ) or processed_activity.get("name", "")
-            if search_term and port_name and configured_platforms:
-                platform = configured_platforms[idx % len(configured_platforms)]
-                search_url = generate_booking_search_url_for_platform(
+            search_term = activity.get("booking_search_term", "") or activity.get(
+                "name", ""
+            )
+            if search_term and platform_count:
+                platform = configured_platforms[idx % platform_count]
+                booking_url = generate_booking_search_url_for_platform(
                     search_term, port_name, platform
                 )
-                processed_activity["booking_url"] = search_url
 
-        processed_activities.append(processed_activity)
+        # Copy only activities whose URL changes, so the original is never
+        # modified; unchanged activities are passed through as-is
+        if booking_url != ai_url:
+            activity = {**activity, "booking_url": booking_url}
+        processed_activities.append(activity)
 
     return processed_activities
@@ -1,9 +1,12 @@
+import asyncio
+import hashlib
 import json
 import logging
 import os
 import re
 import time
 import uuid
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from typing import Any, Literal, Optional
 
@@ -11,6 +14,7 @@ import httpx
 from dotenv import load_dotenv
 from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field, field_validator, model_validator
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
@@ -250,14 +254,57 @@ def health():
 
 # --- Port Search ---
 
+# CRUISE_PORTS is static for the lifetime of the process, so port responses can
+# be validated with ETags derived from the request parameters alone. Conditional
+# requests are answered with 304 before the port list is scanned or serialized.
+_PORTS_DIGEST = hashlib.blake2b(
+    json.dumps(CRUISE_PORTS, sort_keys=True).encode(), digest_size=8
+).hexdigest()
+_PORTS_CACHE_CONTROL = "public, max-age=3600"
+_REGIONS = sorted({p["region"] for p in CRUISE_PORTS})
 
-@app.get("/api/ports/search")
+
+def _port_etag(*parts: Any) -> str:
+    """Build a strong ETag for a port-catalogue response."""
+    key = ":".join([_PORTS_DIGEST, *map(str, parts)]).encode()
+    return f'"{hashlib.blake2b(key, digest_size=8).hexdigest()}"'
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """Evaluate If-None-Match against ``etag`` using weak comparison."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def _port_cache_headers(etag: str) -> dict[str, str]:
+    return {"ETag": etag, "Cache-Control": _PORTS_CACHE_CONTROL}
+
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=_port_cache_headers(etag))
+
+
+_REGIONS_ETAG = _port_etag("regions")
+
+
+# Port responses are plain dicts from ports_data and are returned as prebuilt
+# ORJSONResponses, skipping FastAPI's jsonable_encoder pass over every port.
+@app.get("/api/ports/search", response_model=None)
 def search_ports(
+    request: Request,
     q: str = Query("", min_length=0),
     region: Optional[str] = None,
     limit: int = Query(20, le=500),
-):
+) -> Response:
     query = q.lower().strip()
+    etag = _port_etag("search", query, (region or "").lower(), limit)
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
+
     results = []
     for port in CRUISE_PORTS:
         if region and str(port["region"]).lower() != region.lower():
@@ -269,17 +316,50 @@ def search_ports(
         results.append(port)
         if len(results) >= limit:
             break
-    return results
+    return ORJSONResponse(content=results, headers=_port_cache_headers(etag))
 
 
-@app.get("/api/ports/regions")
-def list_regions():
-    regions = sorted(set(p["region"] for p in CRUISE_PORTS))
-    return regions
+@app.get("/api/ports/regions", response_model=None)
+def list_regions(request: Request) -> Response:
+    if _etag_matches(request, _REGIONS_ETAG):
+        return _not_modified(_REGIONS_ETAG)
+    return ORJSONResponse(content=_REGIONS, headers=_port_cache_headers(_REGIONS_ETAG))
 
 
 # --- Weather (Open-Meteo) ---
 
+_OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast"
+# Split timeouts so a stalled Open-Meteo fails fast instead of holding the
+# request (and, for plan generation, the LLM call behind it) for 15s.
+_WEATHER_TIMEOUT = httpx.Timeout(connect=2.0, read=4.0, write=2.0, pool=2.0)
+_WEATHER_ATTEMPTS = 2
+_WEATHER_RETRY_BACKOFF = 0.1
+
+
+async def _fetch_plan_weather(params: dict[str, Any]) -> Optional[dict]:
+    """Fetch the forecast used in plan prompts, retrying transient failures.
+
+    Returns None if the forecast could not be retrieved; plan generation
+    carries on without weather in that case.
+    """
+    async with httpx.AsyncClient(timeout=_WEATHER_TIMEOUT) as client:
+        for attempt in range(_WEATHER_ATTEMPTS):
+            if attempt:
+                await asyncio.sleep(_WEATHER_RETRY_BACKOFF * 2 ** (attempt - 1))
+            try:
+                resp = await client.get(_OPEN_METEO_URL, params=params)
+            except httpx.TransportError as e:
+                logger.warning(
+                    f"Weather request failed (attempt {attempt + 1}): {str(e)}"
+                )
+                continue
+            if resp.status_code == 200:
+                return resp.json()
+            logger.warning(f"Weather API returned status {resp.status_code}")
+            if resp.status_code < 500:
+                return None
+    return None
+
 
 @app.get("/api/weather")
 async def get_weather(
@@ -306,10 +386,8 @@ async def get_weather(
         params["forecast_days"] = 7
 
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(
-                "https://api.open-meteo.com/v1/forecast", params=params, timeout=15
-            )
+        async with httpx.AsyncClient(timeout=_WEATHER_TIMEOUT) as client:
+            resp = await client.get(_OPEN_METEO_URL, params=params)
             if resp.status_code != 200:
                 logger.error(
                     f"Weather API returned status {resp.status_code}: {resp.text}"
@@ -361,13 +439,73 @@ async def get_weather(
         )
 
 
+# --- Stale plan fallback ---
+
+# Last successfully generated plan per port call and preferences. When the LLM is
+# unavailable (quota exhausted, transient API failure) a previous plan for the
+# same request is served instead of a 503. The cache is per-process and
+# bounded; a cold worker simply falls through to the error response.
+_STALE_PLAN_MAX_ENTRIES = 256
+_stale_plans: "OrderedDict[tuple, dict]" = OrderedDict()
+
+
+def _stale_plan_key(data: GeneratePlanInput) -> tuple:
+    # Everything that goes into the prompt is part of the key: a plan built for
+    # an 18:00 departure must never be served to a passenger leaving at 12:00.
+    prefs = data.preferences
+    return (
+        data.port_name.strip().lower(),
+        data.port_country.strip().lower(),
+        data.latitude,
+        data.longitude,
+        data.arrival,
+        data.departure,
+        data.ship_name.strip().lower(),
+        prefs.party_type,
+        prefs.activity_level,
+        prefs.transport_mode,
+        prefs.budget,
+        prefs.currency,
+    )
+
+
+def _remember_plan(data: GeneratePlanInput, plan: dict) -> None:
+    key = _stale_plan_key(data)
+    _stale_plans[key] = plan
+    _stale_plans.move_to_end(key)
+    while len(_stale_plans) > _STALE_PLAN_MAX_ENTRIES:
+        _stale_plans.popitem(last=False)
+
+
+def _stale_plan_response(data: GeneratePlanInput, response: Response) -> Optional[dict]:
+    """Return the last good plan for this request, marked stale, if any."""
+    cached = _stale_plans.get(_stale_plan_key(data))
+    if cached is None:
+        return None
+    logger.warning(
+        f"Serving stale plan generated at {cached['generated_at']} "
+        f"for port {data.port_name}"
+    )
+    response.headers["X-Cache"] = "stale"
+    response.headers["Warning"] = '110 - "Response is stale"'
+    return {
+        **cached,
+        "plan_id": str(uuid.uuid4()),
+        "trip_id": data.trip_id,
+        "port_id": data.port_id,
+    }
+
+
 # --- Day Plan Generation (Gemini 2.0 Flash) ---
 
 
 @app.post("/api/plans/generate")
 @limiter.limit("10/minute")
 async def generate_plan(
-    request: Request, data: GeneratePlanInput, x_device_id: str = Header(max_length=200)
+    request: Request,
+    response: Response,
+    data: GeneratePlanInput,
+    x_device_id: str = Header(max_length=200),
 ):
     """Generate an AI-powered day plan for a cruise port visit.
 
@@ -391,28 +529,22 @@ async def generate_plan(
     try:
         arrival_date = port_arrival_raw[:10] if port_arrival_raw else None
         logger.info(f"Fetching weather for {port_name_raw} on {arrival_date}")
-        async with httpx.AsyncClient() as client:
-            params = {
-                "latitude": port_latitude,
-                "longitude": port_longitude,
-                "daily": (
-                    "temperature_2m_max,temperature_2m_min,precipitation_sum,"
-                    "weathercode,windspeed_10m_max"
-                ),
-                "timezone": "auto",
-                "temperature_unit": "celsius",
-            }
-            if arrival_date:
-                params["start_date"] = arrival_date
-                params["end_date"] = arrival_date
-            resp = await client.get(
-                "https://api.open-meteo.com/v1/forecast", params=params, timeout=15
-            )
-            if resp.status_code == 200:
-                weather_data = resp.json()
-                logger.info("Weather data retrieved successfully")
-            else:
-                logger.warning(f"Weather API returned status {resp.status_code}")
+        params: dict[str, Any] = {
+            "latitude": port_latitude,
+            "longitude": port_longitude,
+            "daily": (
+                "temperature_2m_max,temperature_2m_min,precipitation_sum,"
+                "weathercode,windspeed_10m_max"
+            ),
+            "timezone": "auto",
+            "temperature_unit": "celsius",
+        }
+        if arrival_date:
+            params["start_date"] = arrival_date
+            params["end_date"] = arrival_date
+        weather_data = await _fetch_plan_weather(params)
+        if weather_data is not None:
+            logger.info("Weather data retrieved successfully")
     except Exception as e:
         logger.warning(f"Failed to fetch weather data (non-blocking): {str(e)}")
         weather_data = None
@@ -542,6 +674,9 @@ Return ONLY valid JSON (no markdown, no code fences) in this exact format:
         emit_ai_generation_metric(
             latency_ms=(time.monotonic() - ai_start) * 1000, success=False
         )
+        stale = _stale_plan_response(data, response)
+        if stale is not None:
+            return stale
         raise HTTPException(
             status_code=503,
             detail={
@@ -583,6 +718,9 @@ Return ONLY valid JSON (no markdown, no code fences) in this exact format:
         emit_ai_generation_metric(
             latency_ms=(time.monotonic() - ai_start) * 1000, success=False
         )
+        stale = _stale_plan_response(data, response)
+        if stale is not None:
+            return stale
         raise HTTPException(
             status_code=503,
             detail={
@@ -641,5 +779,8 @@ Return ONLY valid JSON (no markdown, no code fences) in this exact format:
         "plan": plan_data,
         "generated_at": now.isoformat(),
     }
+    # The LLM may return valid JSON that is not an object; only cache real plans
+    if isinstance(plan_data, dict) and not plan_data.get("parse_error"):
+        _remember_plan(data, plan)
     logger.info(f"Successfully generated plan {plan['plan_id']} for port {port_name}")
     return plan
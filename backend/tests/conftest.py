@@ -0,0 +1,60 @@
+"""
+Shared fixtures for the backend API test suite.
+
+The server module, LLM mock and Open-Meteo stub live in the repository-root
+conftest.py, which the integration tests share.
+
+The suite can be run under pytest-xdist (``-n auto --dist=loadfile``), where
+workers are separate processes. Session fixtures are then built once per
+worker, so no fixture may rely on state left behind by another test module.
+"""
+
+import httpx
+import pytest
+import pytest_asyncio
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture(autouse=True)
+def _reset_server_state(server_module):
+    """Stop rate-limit counters and stale plans leaking between tests."""
+    server_module.limiter.reset()
+    server_module._stale_plans.clear()
+
+
+@pytest.fixture(scope="session")
+def app(server_module):
+    return server_module.app
+
+
+@pytest.fixture(scope="session")
+def client(app):
+    """One TestClient shared by every test in the session."""
+    return TestClient(app)
+
+
+@pytest_asyncio.fixture
+async def aclient(app):
+    """Async client that drives the app in-process, without TestClient's thread."""
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as c:
+        yield c
+
+
+@pytest.fixture(autouse=True)
+def groq_key(request, monkeypatch):
+    """Configure the AI service with a dummy Groq API key.
+
+    Tests marked ``no_groq_key`` run with the AI service unconfigured instead.
+    """
+    if request.node.get_closest_marker("no_groq_key"):
+        monkeypatch.delenv("GROQ_API_KEY", raising=False)
+    else:
+        monkeypatch.setenv("GROQ_API_KEY", "test-key")
+
+
+@pytest.fixture
+def weather_stub(weather_stub_factory):
+    """Open-Meteo answers 404, so plans are generated without weather."""
+    return weather_stub_factory()
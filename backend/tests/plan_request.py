@@ -0,0 +1,27 @@
+"""
+Plan-generation request shared by the backend test modules.
+"""
+
+import json
+
+PLAN_PAYLOAD = {
+    "trip_id": "trip-123",
+    "port_id": "port-456",
+    "port_name": "Barcelona",
+    "port_country": "Spain",
+    "latitude": 41.38,
+    "longitude": 2.19,
+    "arrival": "2027-06-01T08:00:00",
+    "departure": "2027-06-01T18:00:00",
+    "ship_name": "Test Ship",
+    "preferences": {
+        "party_type": "solo",
+        "activity_level": "light",
+        "transport_mode": "walking",
+        "budget": "free",
+    },
+}
+
+# Plan tests post the same payload many times; encode it once.
+PLAN_BODY = json.dumps(PLAN_PAYLOAD).encode()
+PLAN_HEADERS = {"Content-Type": "application/json", "X-Device-Id": "test-device"}
@@ -1,97 +1,75 @@
-import json
-import os
-import sys
-from unittest.mock import MagicMock, patch
+import httpx
+import pytest
+from plan_request import PLAN_BODY, PLAN_HEADERS
 
-from fastapi.testclient import TestClient
 
-# Import app from parent directory
-sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-
-import server  # noqa: E402
-from server import app  # noqa: E402
-
-client = TestClient(app)
-
-
-def test_health_check():
+def test_health_check(client):
     """Test that health check endpoint works."""
-    with patch.dict(os.environ, {"GROQ_API_KEY": "test-key"}):
-        response = client.get("/api/health")
-        assert response.status_code == 200
-        data = response.json()
-        assert data["status"] == "ok"
-        assert "checks" in data
-
-
-@patch("server.LLMClient")
-def test_generate_plan_success(mock_llm_client_class):
-    """Test successful plan generation with port details in request body."""
-    # Setup mocks
-    mock_device_id = "test-device"
-
-    # Mock LLM Client
-    mock_llm_instance = MagicMock()
-    mock_llm_client_class.return_value = mock_llm_instance
-    plan_json = json.dumps({"plan_title": "Mock Plan", "activities": []})
-    mock_llm_instance.generate_day_plan.return_value = plan_json
-    mock_llm_instance.parse_json_response.return_value = json.loads(plan_json)
-
-    payload = {
-        "trip_id": "trip-123",
-        "port_id": "port-456",
-        "port_name": "Barcelona",
-        "port_country": "Spain",
-        "latitude": 41.38,
-        "longitude": 2.19,
-        "arrival": "2027-06-01T08:00:00",
-        "departure": "2027-06-01T18:00:00",
-        "ship_name": "Test Ship",
-        "preferences": {
-            "party_type": "solo",
-            "activity_level": "light",
-            "transport_mode": "walking",
-            "budget": "free",
-        },
-    }
-
-    with patch("httpx.AsyncClient") as mock_async_client:
-        # Mock weather API response
-        mock_client = MagicMock()
-        mock_async_client.return_value.__aenter__.return_value = mock_client
-        mock_weather_response = MagicMock()
-        mock_weather_response.status_code = 404  # Weather fail shouldn't break plan
-        mock_client.get.return_value = mock_weather_response
-
-        with patch.dict(os.environ, {"GROQ_API_KEY": "test-key"}):
-            response = client.post(
-                "/api/plans/generate",
-                json=payload,
-                headers={"X-Device-Id": mock_device_id},
-            )
+    response = client.get("/api/health")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "ok"
+    assert "checks" in data
+
+
+_FORECAST = {"daily": {"temperature_2m_max": [24.0], "temperature_2m_min": [18.0]}}
+
+_MOCK_PLAN = {"plan_title": "Mock Plan", "activities": []}
+_MOCK_PLAN_JSON = '{"plan_title": "Mock Plan", "activities": []}'
+
+
+@pytest.fixture
+def weather(request, weather_stub_factory, monkeypatch):
+    """Patch Open-Meteo to behave as named by the test parameter."""
+    if request.param == "forecast":
+        return weather_stub_factory(status=200, json=_FORECAST)
+    if request.param == "unavailable":
+        return weather_stub_factory(status=404)
+    monkeypatch.setattr("server._WEATHER_RETRY_BACKOFF", 0)
+    return weather_stub_factory(exc=httpx.ConnectError("unreachable"))
+
+
+@pytest.mark.parametrize(
+    "weather, expected_weather",
+    [
+        ("forecast", _FORECAST["daily"]),
+        ("unavailable", None),
+        ("unreachable", None),
+    ],
+    indirect=["weather"],
+)
+@pytest.mark.asyncio
+async def test_generate_plan_success(aclient, mock_llm, weather, expected_weather):
+    """Plans are generated from request port details whatever the weather does."""
+    mock_llm.generate_day_plan.return_value = _MOCK_PLAN_JSON
+    # The server rewrites plan["activities"] in place; keep the constant pristine.
+    mock_llm.parse_json_response.return_value = dict(_MOCK_PLAN)
+
+    response = await aclient.post(
+        "/api/plans/generate",
+        content=PLAN_BODY,
+        headers=PLAN_HEADERS,
+    )
 
     assert response.status_code == 200
     data = response.json()
     assert data["plan"]["plan_title"] == "Mock Plan"
     assert data["port_name"] == "Barcelona"
     assert data["port_country"] == "Spain"
+    assert data["weather"] == expected_weather
     assert "plan_id" in data
 
 
-def test_cors_allowed_origin():
+def test_cors_allowed_origin(client, server_module):
     """Allowed origin receives Access-Control-Allow-Origin header."""
-    allowed = server._allowed_origins[0]
-    with patch.dict(os.environ, {"GROQ_API_KEY": "test-key"}):
-        response = client.get("/api/health", headers={"Origin": allowed})
+    allowed = server_module._allowed_origins[0]
+    response = client.get("/api/health", headers={"Origin": allowed})
     assert response.headers.get("access-control-allow-origin") == allowed
 
 
-def test_cors_disallowed_origin():
+def test_cors_disallowed_origin(client):
     """Unknown origin does not receive Access-Control-Allow-Origin header."""
-    with patch.dict(os.environ, {"GROQ_API_KEY": "test-key"}):
-        response = client.get(
-            "/api/health", headers={"Origin": "http://evil.example.com"}
-        )
+    response = client.get("/api/health", headers={"Origin": "http://evil.example.com"})
     assert "access-control-allow-origin" not in response.headers
 
 
@@ -102,6 +80,41 @@ def test_cors_origins_parsed_from_env():
     assert result == ["https://app.example.com", "https://staging.example.com"]
 
 
-def test_cors_no_wildcard():
+def test_cors_no_wildcard(server_module):
     """Wildcard '*' is never used as an allowed origin."""
-    assert "*" not in server._allowed_origins
+    assert "*" not in server_module._allowed_origins
+
+
+def test_port_search_sets_etag(client):
+    """Port search responses carry a cacheable ETag."""
+    response = client.get("/api/ports/search?q=barcelona")
+    assert response.status_code == 200
+    assert response.headers["etag"].startswith('"')
+    assert "max-age" in response.headers["cache-control"]
+
+
+def test_port_search_not_modified(client):
+    """Matching If-None-Match short-circuits port search with 304."""
+    etag = client.get("/api/ports/search?q=barcelona").headers["etag"]
+    response = client.get(
+        "/api/ports/search?q=barcelona", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+
+def test_port_search_etag_varies_with_query(client):
+    """Different search parameters produce different ETags."""
+    first = client.get("/api/ports/search?q=barcelona").headers["etag"]
+    second = client.get("/api/ports/search?q=barcelona&limit=5").headers["etag"]
+    response = client.get("/api/ports/search?q=rome", headers={"If-None-Match": first})
+    assert first != second
+    assert response.status_code == 200
+
+
+def test_list_regions_not_modified(client):
+    """Regions honour If-None-Match, including weak validators."""
+    etag = client.get("/api/ports/regions").headers["etag"]
+    response = client.get("/api/ports/regions", headers={"If-None-Match": f"W/{etag}"})
+    assert response.status_code == 304
@@ -2,37 +2,36 @@
 Test suite for backend error handling and logging improvements.
 """
 
-import os
-import sys
-from unittest.mock import AsyncMock, MagicMock, patch
+import json
+import re
 
-from fastapi.testclient import TestClient
+import httpx
+import pytest
+from plan_request import PLAN_BODY, PLAN_HEADERS, PLAN_PAYLOAD
 
-# Import app from parent directory
-sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-
-from server import app  # noqa: E402
-
-client = TestClient(app)
+from llm_client import (
+    LLMAPIError,
+    LLMAuthenticationError,
+    LLMQuotaExceededError,
+)
 
 
 class TestHealthCheck:
     """Test the enhanced health check endpoint."""
 
-    def test_health_check_all_services_healthy(self):
+    def test_health_check_all_services_healthy(self, client):
         """Test health check when all services are healthy."""
-        with patch.dict(os.environ, {"GROQ_API_KEY": "test-key"}):
-            response = client.get("/api/health")
+        response = client.get("/api/health")
 
         assert response.status_code == 200
         data = response.json()
         assert data["status"] == "ok"
         assert data["checks"]["ai_service"] == "configured"
 
-    def test_health_check_ai_service_not_configured(self):
+    @pytest.mark.no_groq_key
+    def test_health_check_ai_service_not_configured(self, client):
         """Test health check when AI service is not configured."""
-        with patch.dict(os.environ, {}, clear=True):
-            response = client.get("/api/health")
+        response = client.get("/api/health")
 
         assert response.status_code == 200
         data = response.json()
@@ -43,74 +42,43 @@ class TestHealthCheck:
 class TestWeatherAPIErrors:
     """Test weather API error handling."""
 
-    def test_weather_service_unavailable(self):
+    @pytest.mark.asyncio
+    async def test_weather_service_unavailable(self, aclient, weather_stub_factory):
         """Test weather endpoint handles service unavailability."""
-        with patch("httpx.AsyncClient") as mock_client_class:
-            mock_client = MagicMock()
-            mock_client.__aenter__.return_value = mock_client
-            mock_client_class.return_value = mock_client
-
-            mock_response = AsyncMock()
-            mock_response.status_code = 500
-            mock_response.text = "Internal Server Error"
-            mock_client.get = AsyncMock(return_value=mock_response)
+        weather_stub_factory(status=500, text="Internal Server Error")
 
-            response = client.get("/api/weather?latitude=40.7128&longitude=-74.0060")
+        response = await aclient.get("/api/weather?latitude=40.7128&longitude=-74.0060")
 
-            assert response.status_code == 502
-            data = response.json()
-            assert "detail" in data
-            assert data["detail"]["error"] == "weather_service_unavailable"
+        assert response.status_code == 502
+        data = response.json()
+        assert "detail" in data
+        assert data["detail"]["error"] == "weather_service_unavailable"
 
-    def test_weather_service_timeout(self):
+    @pytest.mark.asyncio
+    async def test_weather_service_timeout(self, aclient, weather_stub_factory):
         """Test weather endpoint handles timeouts."""
-        import httpx
-
-        with patch("httpx.AsyncClient") as mock_client_class:
-            mock_client = MagicMock()
-            mock_client.__aenter__.return_value = mock_client
-            mock_client_class.return_value = mock_client
-
-            mock_client.get = AsyncMock(
-                side_effect=httpx.TimeoutException("Request timed out")
-            )
+        weather_stub_factory(exc=httpx.TimeoutException("Request timed out"))
 
-            response = client.get("/api/weather?latitude=40.7128&longitude=-74.0060")
+        response = await aclient.get("/api/weather?latitude=40.7128&longitude=-74.0060")
 
-            assert response.status_code == 504
-            data = response.json()
-            assert "detail" in data
-            assert data["detail"]["error"] == "weather_service_timeout"
+        assert response.status_code == 504
+        data = response.json()
+        assert "detail" in data
+        assert data["detail"]["error"] == "weather_service_timeout"
 
 
 class TestPlanGenerationErrors:
     """Test plan generation error scenarios."""
 
-    def test_generate_plan_missing_api_key(self):
+    @pytest.mark.no_groq_key
+    @pytest.mark.asyncio
+    async def test_generate_plan_missing_api_key(self, aclient, weather_stub):
         """Test plan generation fails gracefully when API key is missing."""
-        with patch.dict(os.environ, {}, clear=True):
-            with patch("httpx.AsyncClient"):
-                response = client.post(
-                    "/api/plans/generate",
-                    json={
-                        "trip_id": "trip-123",
-                        "port_id": "port-456",
-                        "port_name": "Barcelona",
-                        "port_country": "Spain",
-                        "latitude": 41.38,
-                        "longitude": 2.19,
-                        "arrival": "2027-06-01T08:00:00",
-                        "departure": "2027-06-01T18:00:00",
-                        "ship_name": "Test Ship",
-                        "preferences": {
-                            "party_type": "solo",
-                            "activity_level": "light",
-                            "transport_mode": "walking",
-                            "budget": "free",
-                        },
-                    },
-                    headers={"X-Device-Id": "test-device"},
-                )
+        response = await aclient.post(
+            "/api/plans/generate",
+            content=PLAN_BODY,
+            headers=PLAN_HEADERS,
+        )
 
         assert response.status_code == 503
         data = response.json()
@@ -118,40 +86,18 @@ class TestPlanGenerationErrors:
         assert data["detail"]["error"] == "ai_service_not_configured"
         assert "troubleshooting" in data["detail"]
 
-    @patch("server.LLMClient")
-    def test_generate_plan_quota_exceeded(self, mock_llm_client_class):
+    @pytest.mark.asyncio
+    async def test_generate_plan_quota_exceeded(self, mock_llm, aclient, weather_stub):
         """Test plan generation handles quota exceeded errors."""
-        from llm_client import LLMQuotaExceededError
-
-        mock_llm_instance = MagicMock()
-        mock_llm_client_class.return_value = mock_llm_instance
-        mock_llm_instance.generate_day_plan.side_effect = LLMQuotaExceededError(
+        mock_llm.generate_day_plan.side_effect = LLMQuotaExceededError(
             "Quota exceeded for this project"
         )
 
-        with patch.dict(os.environ, {"GROQ_API_KEY": "test-key"}):
-            with patch("httpx.AsyncClient"):
-                response = client.post(
-                    "/api/plans/generate",
-                    json={
-                        "trip_id": "trip-123",
-                        "port_id": "port-456",
-                        "port_name": "Barcelona",
-                        "port_country": "Spain",
-                        "latitude": 41.38,
-                        "longitude": 2.19,
-                        "arrival": "2027-06-01T08:00:00",
-                        "departure": "2027-06-01T18:00:00",
-                        "ship_name": "Test Ship",
-                        "preferences": {
-                            "party_type": "solo",
-                            "activity_level": "light",
-                            "transport_mode": "walking",
-                            "budget": "free",
-                        },
-                    },
-                    headers={"X-Device-Id": "test-device"},
-                )
+        response = await aclient.post(
+            "/api/plans/generate",
+            content=PLAN_BODY,
+            headers=PLAN_HEADERS,
+        )
 
         assert response.status_code == 503
         data = response.json()
@@ -159,83 +105,41 @@ class TestPlanGenerationErrors:
         assert data["detail"]["error"] == "ai_service_quota_exceeded"
         assert "retry_after" in data["detail"]
 
-    @patch("server.LLMClient")
-    def test_generate_plan_authentication_error(self, mock_llm_client_class):
+    @pytest.mark.asyncio
+    async def test_generate_plan_authentication_error(
+        self, mock_llm, aclient, weather_stub
+    ):
         """Test plan generation handles authentication errors."""
-        from llm_client import LLMAuthenticationError
-
-        mock_llm_instance = MagicMock()
-        mock_llm_client_class.return_value = mock_llm_instance
-        mock_llm_instance.generate_day_plan.side_effect = LLMAuthenticationError(
+        mock_llm.generate_day_plan.side_effect = LLMAuthenticationError(
             "Invalid API key provided - 401 authentication failed"
         )
 
-        with patch.dict(os.environ, {"GROQ_API_KEY": "invalid-key"}):
-            with patch("httpx.AsyncClient"):
-                response = client.post(
-                    "/api/plans/generate",
-                    json={
-                        "trip_id": "trip-123",
-                        "port_id": "port-456",
-                        "port_name": "Barcelona",
-                        "port_country": "Spain",
-                        "latitude": 41.38,
-                        "longitude": 2.19,
-                        "arrival": "2027-06-01T08:00:00",
-                        "departure": "2027-06-01T18:00:00",
-                        "ship_name": "Test Ship",
-                        "preferences": {
-                            "party_type": "solo",
-                            "activity_level": "light",
-                            "transport_mode": "walking",
-                            "budget": "free",
-                        },
-                    },
-                    headers={"X-Device-Id": "test-device"},
-                )
+        response = await aclient.post(
+            "/api/plans/generate",
+            content=PLAN_BODY,
+            headers=PLAN_HEADERS,
+        )
 
         assert response.status_code == 503
         data = response.json()
         assert "detail" in data
         assert data["detail"]["error"] == "ai_service_auth_failed"
 
-    @patch("server.LLMClient")
-    def test_generate_plan_with_malformed_json_response(self, mock_llm_client_class):
+    @pytest.mark.asyncio
+    async def test_generate_plan_with_malformed_json_response(
+        self, mock_llm, aclient, weather_stub
+    ):
         """Test plan generation handles malformed JSON from AI."""
-        import json as json_module
-
-        mock_llm_instance = MagicMock()
-        mock_llm_client_class.return_value = mock_llm_instance
-        mock_llm_instance.generate_day_plan.return_value = (
-            "This is not valid JSON {broken"
-        )
-        mock_llm_instance.parse_json_response.side_effect = json_module.JSONDecodeError(
+        mock_llm.generate_day_plan.return_value = "This is not valid JSON {broken"
+        mock_llm.parse_json_response.side_effect = json.JSONDecodeError(
             "Expecting value", "This is not valid JSON {broken", 0
         )
 
-        with patch.dict(os.environ, {"GROQ_API_KEY": "test-key"}):
-            with patch("httpx.AsyncClient"):
-                response = client.post(
-                    "/api/plans/generate",
-                    json={
-                        "trip_id": "trip-123",
-                        "port_id": "port-456",
-                        "port_name": "Barcelona",
-                        "port_country": "Spain",
-                        "latitude": 41.38,
-                        "longitude": 2.19,
-                        "arrival": "2027-06-01T08:00:00",
-                        "departure": "2027-06-01T18:00:00",
-                        "ship_name": "Test Ship",
-                        "preferences": {
-                            "party_type": "solo",
-                            "activity_level": "light",
-                            "transport_mode": "walking",
-                            "budget": "free",
-                        },
-                    },
-                    headers={"X-Device-Id": "test-device"},
-                )
+        response = await aclient.post(
+            "/api/plans/generate",
+            content=PLAN_BODY,
+            headers=PLAN_HEADERS,
+        )
 
         # Should still return 200 but with parse_error flag
         assert response.status_code == 200
@@ -243,17 +147,172 @@ class TestPlanGenerationErrors:
         assert data["plan"]["parse_error"] is True
         assert "raw_response" in data["plan"]
 
+    @pytest.mark.asyncio
+    async def test_generate_plan_with_non_object_json_response(
+        self, mock_llm, aclient, weather_stub
+    ):
+        """Valid JSON that is not an object is returned as-is, not a 500."""
+        mock_llm.generate_day_plan.return_value = "[]"
+        mock_llm.parse_json_response.return_value = []
+
+        response = await aclient.post(
+            "/api/plans/generate",
+            content=PLAN_BODY,
+            headers=PLAN_HEADERS,
+        )
+
+        assert response.status_code == 200
+        assert response.json()["plan"] == []
+
+
+class TestPlanWeatherRetry:
+    """Test the weather fetch used during plan generation."""
+
+    @pytest.mark.asyncio
+    async def test_weather_timeout_is_retried_once(
+        self, mock_llm, aclient, weather_stub_factory, monkeypatch
+    ):
+        """A transient weather timeout is retried and the forecast still used."""
+        mock_llm.generate_day_plan.return_value = "{}"
+        mock_llm.parse_json_response.return_value = {"activities": []}
+
+        daily = {"temperature_2m_max": [24.0], "temperature_2m_min": [18.0]}
+        route = weather_stub_factory()
+        route.side_effect = [
+            httpx.TimeoutException("slow"),
+            httpx.Response(200, json={"daily": daily}),
+        ]
+
+        monkeypatch.setattr("server._WEATHER_RETRY_BACKOFF", 0)
+        response = await aclient.post(
+            "/api/plans/generate",
+            content=PLAN_BODY,
+            headers=PLAN_HEADERS,
+        )
+
+        assert response.status_code == 200
+        assert route.call_count == 2
+        assert response.json()["weather"] == daily
+
+    @pytest.mark.asyncio
+    async def test_weather_failures_do_not_block_plan(
+        self, mock_llm, aclient, weather_stub_factory, monkeypatch
+    ):
+        """Plans are still generated when every weather attempt fails."""
+        mock_llm.generate_day_plan.return_value = "{}"
+        mock_llm.parse_json_response.return_value = {"activities": []}
+
+        route = weather_stub_factory(exc=httpx.ConnectError("down"))
+
+        monkeypatch.setattr("server._WEATHER_RETRY_BACKOFF", 0)
+        response = await aclient.post(
+            "/api/plans/generate",
+            content=PLAN_BODY,
+            headers=PLAN_HEADERS,
+        )
+
+        assert response.status_code == 200
+        assert route.call_count == 2
+        assert response.json()["weather"] is None
+
+
+class TestStalePlanFallback:
+    """Test serving the last good plan when the AI service is unavailable."""
+
+    @pytest.mark.asyncio
+    async def test_quota_exceeded_serves_stale_plan(
+        self, mock_llm, aclient, weather_stub
+    ):
+        """A previously generated plan is returned, flagged stale, on quota errors."""
+        mock_llm.generate_day_plan.return_value = "{}"
+        mock_llm.parse_json_response.return_value = {
+            "plan_title": "Cached Plan",
+            "activities": [],
+        }
+
+        fresh = await aclient.post(
+            "/api/plans/generate",
+            content=PLAN_BODY,
+            headers=PLAN_HEADERS,
+        )
+        mock_llm.generate_day_plan.side_effect = LLMQuotaExceededError(
+            "Quota exceeded for this project"
+        )
+        stale = await aclient.post(
+            "/api/plans/generate",
+            json={**PLAN_PAYLOAD, "trip_id": "trip-789"},
+            headers={"X-Device-Id": "test-device"},
+        )
+
+        assert fresh.status_code == 200
+        assert "x-cache" not in fresh.headers
+        assert stale.status_code == 200
+        assert stale.headers["x-cache"] == "stale"
+        assert stale.headers["warning"].startswith("110")
+        data = stale.json()
+        assert data["plan"]["plan_title"] == "Cached Plan"
+        assert data["trip_id"] == "trip-789"
+        assert data["plan_id"] != fresh.json()["plan_id"]
+        assert data["generated_at"] == fresh.json()["generated_at"]
+
+    @pytest.mark.asyncio
+    async def test_stale_plan_not_served_for_different_departure(
+        self, mock_llm, aclient, weather_stub
+    ):
+        """A plan cached for one departure time is not reused for another."""
+        mock_llm.generate_day_plan.return_value = "{}"
+        mock_llm.parse_json_response.return_value = {"activities": []}
+
+        fresh = await aclient.post(
+            "/api/plans/generate",
+            content=PLAN_BODY,
+            headers=PLAN_HEADERS,
+        )
+        mock_llm.generate_day_plan.side_effect = LLMQuotaExceededError(
+            "Quota exceeded for this project"
+        )
+        response = await aclient.post(
+            "/api/plans/generate",
+            json={**PLAN_PAYLOAD, "departure": "2027-06-01T12:00:00"},
+            headers={"X-Device-Id": "test-device"},
+        )
+
+        assert fresh.status_code == 200
+        assert response.status_code == 503
+        assert response.json()["detail"]["error"] == "ai_service_quota_exceeded"
+
+    @pytest.mark.asyncio
+    async def test_api_error_without_stale_plan_returns_503(
+        self, mock_llm, aclient, weather_stub
+    ):
+        """Without a cached plan, AI service errors still surface as 503."""
+        mock_llm.generate_day_plan.side_effect = LLMAPIError("timeout")
+
+        response = await aclient.post(
+            "/api/plans/generate",
+            content=PLAN_BODY,
+            headers=PLAN_HEADERS,
+        )
+
+        assert response.status_code == 503
+        assert response.json()["detail"]["error"] == "ai_service_unavailable"
+
+
+_UUID_PATTERN = r"[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}"
+
 
 class TestRequestIDTracking:
     """Test request ID tracking for observability."""
 
-    def test_request_id_added_to_response(self):
-        """Test that X-Request-ID header is added to responses."""
-        response = client.get("/api/health")
-        assert "X-Request-ID" in response.headers
-
-    def test_request_id_preserved_if_provided(self):
-        """Test that provided X-Request-ID is preserved."""
-        custom_id = "custom-request-id-123"
-        response = client.get("/api/health", headers={"X-Request-ID": custom_id})
-        assert response.headers["X-Request-ID"] == custom_id
+    @pytest.mark.parametrize(
+        "headers, expected_match",
+        [
+            ({}, _UUID_PATTERN),
+            ({"X-Request-ID": "custom-request-id-123"}, r"custom-request-id-123"),
+        ],
+        ids=["generated", "preserved"],
+    )
+    def test_request_id_header(self, client, headers, expected_match):
+        """X-Request-ID is a fresh UUID, or the caller's ID when one is sent."""
+        response = client.get("/api/health", headers=headers)
+        assert re.fullmatch(expected_match, response.headers["X-Request-ID"])
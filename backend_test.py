@@ -3,79 +3,230 @@
 Comprehensive API Testing for ShoreExplorer Backend
 Tests remaining endpoints: health, port search, weather, and AI plan generation
 (Trip/plan CRUD is now handled client-side via localStorage)
+
+Set INPROCESS=1 to dispatch requests straight to the FastAPI app through
+httpx's ASGI transport instead of a server on localhost:8001. In that mode the
+Groq chat completion is answered from a canned plan (requires respx) unless
+LIVE_LLM=1 is also set; GROQ_API_KEY then defaults to a mock key, so no real
+key is needed.
 """
 
-import requests
+import asyncio
+import contextlib
+import httpx
 import json
+import logging
+import logging.handlers
+import orjson
+import os
+import queue
 import sys
 import uuid
 from datetime import datetime
 
+GROQ_CHAT_URL = "https://api.groq.com/openai/v1/chat/completions"
+
+logger = logging.getLogger("backend_test")
+
+# Status tags used in the output, mapped to logging levels; LOG_LEVEL=WARNING
+# hides the per-request chatter and keeps warnings and failures.
+_LEVELS = {"INFO": logging.INFO, "PASS": logging.INFO, "WARN": logging.WARNING,
+           "FAIL": logging.ERROR, "ERROR": logging.ERROR}
+
+# Characters of a failed response body echoed to the log
+_MAX_LOGGED_BODY = 2048
+
+# Supported methods, mapped to whether they carry a JSON body
+_METHODS = {"GET": False, "POST": True, "PUT": True, "DELETE": False}
+
+# Transient gateway errors on idempotent requests are retried in-band with
+# exponential backoff. POST is excluded so plan generation never double-fires,
+# and 503 is excluded because the API uses it for an unavailable AI service.
+_IDEMPOTENT = frozenset({"GET", "PUT", "DELETE"})
+_RETRY_STATUSES = frozenset({502, 504})
+_STATUS_RETRIES = 2
+_RETRY_BACKOFF = 0.1
+
+# Acceptable status codes for run_test; plan generation may return 503 when
+# the AI service is unavailable (e.g. CI's mock Groq key)
+_OK = frozenset({200})
+_OK_OR_BUSY = frozenset({200, 503})
+_UNPROCESSABLE = frozenset({422})
+
+# Plan request shared by the generation and budget tests; copy before changing it
+PLAN_REQUEST = {
+    "trip_id": "test-trip-123",
+    "port_id": "test-port-456",
+    "port_name": "Barcelona",
+    "port_country": "Spain",
+    "latitude": 41.3784,
+    "longitude": 2.1925,
+    "arrival": "2099-06-15T08:00:00",
+    "departure": "2099-06-15T18:00:00",
+    "ship_name": "Test Ship",
+    "preferences": {
+        "party_type": "couple",
+        "activity_level": "moderate",
+        "transport_mode": "mixed",
+        "budget": "medium",
+        "currency": "GBP",
+    },
+}
+
+# The budget probe must not match a plan from the generation sweep: the server
+# serves the last good plan for an identical request when the AI service is
+# unavailable, which would hide the 503 this probe is looking for.
+BUDGET_PROBE_REQUEST = {
+    **PLAN_REQUEST,
+    "trip_id": "test-trip-budget",
+    "arrival": "2099-06-16T09:00:00",
+    "departure": "2099-06-16T17:00:00",
+}
+
+# Substrings that mark an acceptable 503 from the budget probe: budget or quota
+# exhaustion, or the auth failure expected with CI's mock Groq key.
+BUDGET_NEEDLES = (("budget", "exceeded"), ("quota", "exceeded"))
+AUTH_NEEDLES = ("authentication", "mock", "api key")
+
+MOCK_PLAN = {
+    "plan_title": "Barcelona Highlights",
+    "summary": "A canned plan served in place of a live Groq completion.",
+    "return_by": "17:00",
+    "total_estimated_cost": "£40",
+    "activities": [],
+}
+
+# The suite, as (group name, tester method) pairs; groups must not depend on
+# one another since run_all_tests runs them concurrently
+TEST_GROUPS = (
+    ("Health Check", "test_health_endpoint"),
+    ("Port Search & Regions", "test_port_search_endpoints"),
+    ("Weather API Proxy", "test_weather_api"),
+    ("AI Plan Generation with Currency", "test_plan_generation"),
+    ("Budget Exceeded Error Handling", "test_budget_exceeded_error_handling"),
+    ("Generate Plan Requires Device ID", "test_generate_plan_requires_device_id"),
+)
+
 class ShoreExplorerAPITester:
     def __init__(self):
-        self.base_url = "http://localhost:8001"
         self.tests_run = 0
         self.tests_passed = 0
-        self.session = requests.Session()
-        self.session.headers.update({'Content-Type': 'application/json'})
+        # One random ID per run, sliced into distinct per-test device IDs
+        self._uid = uuid.uuid4().hex
+        if os.environ.get("INPROCESS"):
+            # No sockets: each request is a direct call into the ASGI app
+            self.base_url = "http://test"
+            if not os.environ.get("LIVE_LLM"):
+                # The server refuses to build an LLM client without a key, even
+                # though _mock_llm answers the Groq call itself
+                os.environ.setdefault("GROQ_API_KEY", "mock-key")
+            transport = httpx.ASGITransport(app=self._load_app())
+        else:
+            # Keep-alive pool shared by the concurrently running tests; the transport
+            # retries connection failures from a just-started server. Requests are
+            # not retried on status: plan generation is rate limited and returns 503
+            # when the AI service is unavailable (CI).
+            self.base_url = "http://localhost:8001"
+            transport = httpx.AsyncHTTPTransport(
+                retries=2,
+                # Keep every pooled connection warm so concurrent bursts reuse them
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=32),
+            )
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={'Content-Type': 'application/json'},
+            transport=transport,
+        )
+
+    @staticmethod
+    def _load_app():
+        """Import the FastAPI app the way uvicorn does, from the backend directory"""
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+        from server import app
+        return app
+
+    def _mock_llm(self):
+        """Answer Groq chat completions with MOCK_PLAN when running in-process"""
+        if not os.environ.get("INPROCESS") or os.environ.get("LIVE_LLM"):
+            return contextlib.nullcontext()
+
+        import respx
+
+        router = respx.mock(assert_all_called=False)
+        router.post(GROQ_CHAT_URL).respond(json={
+            "id": "chatcmpl-backend-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "llama-3.3-70b-versatile",
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": json.dumps(MOCK_PLAN)},
+                "finish_reason": "stop",
+            }],
+        })
+        # Everything else (e.g. Open-Meteo) still goes to the real service
+        router.route().pass_through()
+        return router
 
     def log(self, message, status="INFO"):
-        print(f"[{status}] {message}")
+        logger.log(_LEVELS.get(status, logging.INFO), "[%s] %s", status, message)
+
+    async def _send(self, method, endpoint, data=None, timeout=30, device_id=None):
+        """Send one request on the shared client; callers do their own accounting"""
+        # Set device ID header if provided (Content-Type is set on the client)
+        headers = {'X-Device-Id': device_id} if device_id else None
+        # Encode straight to bytes; Content-Type is set on the client
+        content = orjson.dumps(data) if data is not None and _METHODS[method] else None
+        attempts = 1 + (_STATUS_RETRIES if method in _IDEMPOTENT else 0)
+        for attempt in range(1, attempts + 1):
+            response = await self.client.request(
+                method, f"/{endpoint}", content=content, headers=headers, timeout=timeout
+            )
+            if response.status_code not in _RETRY_STATUSES or attempt == attempts:
+                return response
+            await asyncio.sleep(_RETRY_BACKOFF * 2 ** (attempt - 1))
 
-    def run_test(self, name, method, endpoint, expected_status=200, data=None, timeout=30, device_id=None):
+    async def run_test(self, name, method, endpoint, expected_status=_OK, data=None, timeout=30, device_id=None):
         """Run a single API test"""
-        url = f"{self.base_url}/{endpoint}"
-        self.tests_run += 1
-        
-        self.log(f"Testing {name}...")
-        
-        # Handle both single status code and list of acceptable codes
-        if isinstance(expected_status, int):
-            expected_codes = [expected_status]
-        else:
-            expected_codes = expected_status
-        
-        # Set device ID header if provided
-        headers = {'Content-Type': 'application/json'}
-        if device_id:
-            headers['X-Device-Id'] = device_id
-            
+        log = self.log
+        log(f"Testing {name}...")
+
+        passed, result = False, {}
         try:
-            if method == 'GET':
-                response = requests.get(url, headers=headers, timeout=timeout)
-            elif method == 'POST':
-                response = requests.post(url, json=data, headers=headers, timeout=timeout)
-            elif method == 'PUT':
-                response = requests.put(url, json=data, headers=headers, timeout=timeout)
-            elif method == 'DELETE':
-                response = requests.delete(url, headers=headers, timeout=timeout)
-            else:
-                self.log(f"Unknown method: {method}", "ERROR")
-                return False, {}
+            if method not in _METHODS:
+                log(f"Unknown method: {method}", "ERROR")
+                return passed, result
 
-            success = response.status_code in expected_codes
-            if success:
-                self.tests_passed += 1
-                self.log(f"✅ {name} - Status: {response.status_code}", "PASS")
+            response = await self._send(method, endpoint, data, timeout, device_id)
+
+            status = response.status_code
+            if status in expected_status:
+                passed = True
+                log(f"✅ {name} - Status: {status}", "PASS")
+                body = response.content
                 try:
-                    return success, response.json() if response.text else {}
-                except json.JSONDecodeError:
-                    return success, {"response_text": response.text}
+                    result = orjson.loads(body) if body else {}
+                except orjson.JSONDecodeError:
+                    result = {"response_text": body.decode("utf-8", "replace")}
             else:
-                self.log(f"❌ {name} - Expected {expected_codes}, got {response.status_code}", "FAIL")
-                self.log(f"Response: {response.text}", "ERROR")
-                return False, {}
+                log(f"❌ {name} - Expected {sorted(expected_status)}, got {status}", "FAIL")
+                # Only decode the body when it will be emitted, and cap its size
+                if logger.isEnabledFor(logging.ERROR):
+                    log(f"Response: {response.text[:_MAX_LOGGED_BODY]}", "ERROR")
 
-        except requests.exceptions.Timeout:
-            self.log(f"❌ {name} - Request timed out after {timeout}s", "FAIL")
-            return False, {}
+        except httpx.TimeoutException:
+            log(f"❌ {name} - Request timed out after {timeout}s", "FAIL")
         except Exception as e:
-            self.log(f"❌ {name} - Error: {str(e)}", "FAIL")
-            return False, {}
+            log(f"❌ {name} - Error: {str(e)}", "FAIL")
+        finally:
+            # Counters are flushed once per call
+            self.tests_run += 1
+            self.tests_passed += passed
+        return passed, result
 
-    def test_health_endpoint(self):
+    async def test_health_endpoint(self):
         """Test health check endpoint"""
-        success, response = self.run_test("Health Check", "GET", "api/health")
+        success, response = await self.run_test("Health Check", "GET", "api/health")
         # Accept both "ok" and "degraded" status (degraded when services not configured)
         if success and response.get("status") in ["ok", "degraded"]:
             self.log("Health endpoint working correctly", "PASS")
@@ -84,10 +235,10 @@ class ShoreExplorerAPITester:
             self.log("Health endpoint failed or returned incorrect response", "FAIL")
             return False
 
-    def test_weather_api(self):
+    async def test_weather_api(self):
         """Test weather proxy endpoint with Celsius temperature verification"""
         # Test with Barcelona coordinates
-        success, response = self.run_test(
+        success, response = await self.run_test(
             "Weather API", 
             "GET", 
             "api/weather?latitude=41.38&longitude=2.19",
@@ -115,91 +266,51 @@ class ShoreExplorerAPITester:
                 return False
         return False
 
-    def test_plan_generation(self):
+    async def test_plan_generation(self):
         """Test AI plan generation (may take 15-30 seconds) and currency handling"""
-        device_id = str(uuid.uuid4())
+        device_id = f"backend-test-{self._uid[:8]}"
 
-        # Test plan generation with port details in request body
-        plan_data = {
-            "trip_id": "test-trip-123",
-            "port_id": "test-port-456",
-            "port_name": "Barcelona",
-            "port_country": "Spain",
-            "latitude": 41.3784,
-            "longitude": 2.1925,
-            "arrival": "2099-06-15T08:00:00",
-            "departure": "2099-06-15T18:00:00",
-            "ship_name": "Test Ship",
-            "preferences": {
-                "party_type": "couple",
-                "activity_level": "moderate",
-                "transport_mode": "mixed",
-                "budget": "medium",
-                "currency": "GBP"
-            }
-        }
-        
-        self.log("Starting AI plan generation with GBP currency (expecting budget exceeded error)...", "INFO")
-        success, response = self.run_test("Generate Plan with Currency", "POST", "api/plans/generate", [200, 503], plan_data, timeout=45, device_id=device_id)
-        
-        if not success:
+        # Each currency is an independent request, so send all three at once;
+        # wall time is one LLM round trip rather than three.
+        currencies = ["GBP", "EUR", "USD"]
+        self.log(f"Generating plans for {', '.join(currencies)} concurrently (expecting budget exceeded)...", "INFO")
+        outcomes = await asyncio.gather(*(
+            self.run_test(
+                f"Generate Plan with {currency}", "POST", "api/plans/generate", _OK_OR_BUSY,
+                {**PLAN_REQUEST, "preferences": {**PLAN_REQUEST["preferences"], "currency": currency}},
+                timeout=45, device_id=device_id,
+            )
+            for currency in currencies
+        ))
+
+        if not all(success for success, _ in outcomes):
             return False
-        
-        # Test with different currencies
-        for currency in ["EUR", "USD"]:
-            plan_data["preferences"]["currency"] = currency
-            self.log(f"Testing plan generation with {currency} currency (expecting budget exceeded)...", "INFO")
-            success, response = self.run_test(f"Generate Plan with {currency}", "POST", "api/plans/generate", [200, 503], plan_data, timeout=45, device_id=device_id)
-            if not success:
-                return False
-        
+
         self.log("✅ Currency parameter handling in plan generation working", "PASS")
         return True
 
-    def test_budget_exceeded_error_handling(self):
+    async def test_budget_exceeded_error_handling(self):
         """Test that AI service errors return proper 503 (budget/quota/auth)"""
-        device_id = str(uuid.uuid4())
+        device_id = f"backend-test-{self._uid[8:16]}"
 
-        plan_data = {
-            "trip_id": "test-trip-123",
-            "port_id": "test-port-456",
-            "port_name": "Barcelona",
-            "port_country": "Spain",
-            "latitude": 41.3784,
-            "longitude": 2.1925,
-            "arrival": "2099-06-15T08:00:00",
-            "departure": "2099-06-15T18:00:00",
-            "ship_name": "Test Ship",
-            "preferences": {
-                "party_type": "couple",
-                "activity_level": "moderate", 
-                "transport_mode": "mixed",
-                "budget": "medium",
-                "currency": "GBP"
-            }
-        }
-        
         self.log("Testing budget exceeded error handling...", "INFO")
         
         try:
-            headers = {'Content-Type': 'application/json', 'X-Device-Id': device_id}
-            response = requests.post(f"{self.base_url}/api/plans/generate", json=plan_data, headers=headers, timeout=45)
+            response = await self._send("POST", "api/plans/generate", BUDGET_PROBE_REQUEST, timeout=45, device_id=device_id)
             
             if response.status_code == 503:
                 # Check error message - accept budget exceeded OR auth errors (CI)
-                error_data = response.json()
+                error_data = orjson.loads(response.content)
                 detail = error_data.get("detail", "")
                 # Handle new structured error format (dict) or old string format
                 message = detail.get("message", str(detail)) if isinstance(detail, dict) else detail
                 message_lower = message.lower()
                 
                 # Accept: budget exceeded, quota exceeded, or auth/mock key errors
-                if ("budget" in message_lower and "exceeded" in message_lower) or \
-                   ("quota" in message_lower and "exceeded" in message_lower):
+                if any(all(n in message_lower for n in pair) for pair in BUDGET_NEEDLES):
                     self.log("✅ Budget/quota exceeded returns proper 503", "PASS")
                     self.tests_passed += 1
-                elif "authentication" in message_lower or "mock" in message_lower or \
-                     "api key" in message_lower:
+                elif any(n in message_lower for n in AUTH_NEEDLES):
                     self.log("✅ 503 with auth error (expected in CI environment)", "PASS")
                     self.tests_passed += 1
                 else:
@@ -220,12 +331,23 @@ class ShoreExplorerAPITester:
             self.tests_run += 1
             return False
 
-    def test_port_search_endpoints(self):
+    async def test_port_search_endpoints(self):
         """Test the port search functionality"""
         self.log("Testing port search endpoints...", "INFO")
-        
+
+        # The lookups are independent, so issue them in one concurrent burst
+        # and validate the collected results in order below.
+        calls = {
+            "regions": ("Get Port Regions", "api/ports/regions"),
+            "default": ("Port Search - Default", "api/ports/search"),
+            "barcelona": ("Port Search - Barcelona", "api/ports/search?q=barcelona"),
+            "limit": ("Port Search - Limit 5", "api/ports/search?limit=5"),
+        }
+        outcomes = await asyncio.gather(*(self.run_test(name, "GET", endpoint) for name, endpoint in calls.values()))
+        results = dict(zip(calls, outcomes))
+
         # Test 1: Get regions list
-        success, response = self.run_test("Get Port Regions", "GET", "api/ports/regions")
+        success, response = results["regions"]
         if not success:
             return False
         
@@ -239,15 +361,16 @@ class ShoreExplorerAPITester:
         
         # Check for specific expected regions
         expected_regions = ["Caribbean", "Western Mediterranean", "Alaska", "Northern Europe"]
+        regions = set(response)
         for region in expected_regions:
-            if region not in response:
+            if region not in regions:
                 self.log(f"Missing expected region: {region}", "FAIL")
                 return False
         
         self.log(f"✅ Found {len(response)} regions including expected regions", "PASS")
         
         # Test 2: Default port search (no params - should return first 20 ports)
-        success, response = self.run_test("Port Search - Default", "GET", "api/ports/search")
+        success, response = results["default"]
         if not success:
             return False
         
@@ -270,13 +393,12 @@ class ShoreExplorerAPITester:
         self.log("✅ Default port search returns 20 ports with correct structure", "PASS")
         
         # Test 3: Search for Barcelona
-        success, response = self.run_test("Port Search - Barcelona", "GET", "api/ports/search?q=barcelona")
+        success, response = results["barcelona"]
         if not success:
             return False
         
-        barcelona_found = any(port.get("name", "").lower() == "barcelona" and 
-                            port.get("country", "").lower() == "spain" 
-                            for port in response)
+        found_ports = {(port.get("name", "").lower(), port.get("country", "").lower()) for port in response}
+        barcelona_found = ("barcelona", "spain") in found_ports
         
         if not barcelona_found:
             self.log("Barcelona, Spain not found in search results", "FAIL")
@@ -285,7 +407,7 @@ class ShoreExplorerAPITester:
         self.log("✅ Barcelona search returns Barcelona, Spain", "PASS")
         
         # Test 4: Limit parameter
-        success, response = self.run_test("Port Search - Limit 5", "GET", "api/ports/search?limit=5")
+        success, response = results["limit"]
         if not success:
             return False
         
@@ -298,7 +420,7 @@ class ShoreExplorerAPITester:
         self.log("🎉 All port search tests passed!", "PASS")
         return True
 
-    def test_generate_plan_requires_device_id(self):
+    async def test_generate_plan_requires_device_id(self):
         """Test that generate plan endpoint requires X-Device-Id header."""
         plan_data = {
             "trip_id": "t",
@@ -317,13 +439,21 @@ class ShoreExplorerAPITester:
             },
         }
         # No X-Device-Id header
-        success, _ = self.run_test("Generate Plan No Device ID", "POST", "api/plans/generate", 422, plan_data)
+        success, _ = await self.run_test("Generate Plan No Device ID", "POST", "api/plans/generate", _UNPROCESSABLE, plan_data)
         if success:
             self.log("✅ Generate plan correctly requires X-Device-Id header", "PASS")
             return True
         return False
 
-    def run_all_tests(self):
+    async def _run_group(self, test_name, test_func):
+        """Run one test group, logging rather than propagating its exceptions"""
+        self.log(f"\n--- {test_name} ---", "INFO")
+        try:
+            await test_func()
+        except Exception as e:
+            self.log(f"Test {test_name} failed with exception: {str(e)}", "ERROR")
+
+    async def run_all_tests(self):
         """Run all backend API tests"""
         self.log("=" * 60, "INFO")
         self.log("SHOREEXPLORER BACKEND API TESTING", "INFO")
@@ -332,25 +462,16 @@ class ShoreExplorerAPITester:
         self.log("", "INFO")
 
         try:
-            # Test sequence
-            tests = [
-                ("Health Check", self.test_health_endpoint),
-                ("Port Search & Regions", self.test_port_search_endpoints),
-                ("Weather API Proxy", self.test_weather_api),
-                ("AI Plan Generation with Currency", self.test_plan_generation),
-                ("Budget Exceeded Error Handling", self.test_budget_exceeded_error_handling),
-                ("Generate Plan Requires Device ID", self.test_generate_plan_requires_device_id),
-            ]
-
-            for test_name, test_func in tests:
-                self.log(f"\n--- {test_name} ---", "INFO")
-                try:
-                    test_func()
-                except Exception as e:
-                    self.log(f"Test {test_name} failed with exception: {str(e)}", "ERROR")
+            # The groups are independent, so run them concurrently: total time is
+            # bounded by the slowest group (plan generation) rather than the sum.
+            with self._mock_llm():
+                await asyncio.gather(*(
+                    self._run_group(name, getattr(self, method)) for name, method in TEST_GROUPS
+                ))
 
         finally:
-            pass
+            # Release the pooled connections deterministically
+            await self.client.aclose()
 
         # Print final results
         self.log("", "INFO")
@@ -371,8 +492,27 @@ class ShoreExplorerAPITester:
 
 def main():
     """Main test runner"""
-    tester = ShoreExplorerAPITester()
-    return tester.run_all_tests()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    # Records are queued by the event loop and written to stdout by a listener
+    # thread, so terminal or pipe back-pressure never stalls in-flight requests
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+    logger.propagate = False
+    listener.start()
+    try:
+        tester = ShoreExplorerAPITester()
+        # Use uvloop's faster event loop when it is installed; it is optional
+        try:
+            import uvloop
+        except ImportError:
+            return asyncio.run(tester.run_all_tests())
+        return uvloop.run(tester.run_all_tests())
+    finally:
+        # Drain the queue before exiting
+        listener.stop()
 
 if __name__ == "__main__":
     sys.exit(main())
\ No newline at end of file
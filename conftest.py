@@ -0,0 +1,51 @@
+"""
+Fixtures shared by the backend and integration test suites.
+
+The backend server module is imported lazily through ``server_module`` so
+that collecting a suite does not pull in the app until a test needs it; the
+unit tests never do. Each suite's own conftest resets server state.
+"""
+
+from unittest.mock import MagicMock
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def server_module():
+    """Import the backend server module once per worker session."""
+    import server
+
+    return server
+
+
+@pytest.fixture
+def mock_llm(monkeypatch):
+    """Patch server.LLMClient and return the instance every request gets."""
+    mock_llm_instance = MagicMock()
+    monkeypatch.setattr("server.LLMClient", MagicMock(return_value=mock_llm_instance))
+    return mock_llm_instance
+
+
+@pytest.fixture
+def weather_stub_factory(server_module):
+    """Return a function that routes Open-Meteo requests to a canned answer.
+
+    Requests are intercepted at httpx's transport layer with respx, so the
+    server's real AsyncClient is used. The stub answers every GET with
+    ``status``/``json``/``text`` or raises ``exc``; the returned respx route
+    exposes ``call_count`` and ``side_effect`` for assertions and tweaks.
+    """
+    import respx
+
+    with respx.mock(assert_all_called=False) as router:
+
+        def install(status=404, json=None, text="", exc=None):
+            route = router.get(server_module._OPEN_METEO_URL)
+            if exc is not None:
+                return route.mock(side_effect=exc)
+            if json is not None:
+                return route.respond(status, json=json)
+            return route.respond(status, text=text)
+
+        yield install
@@ -0,0 +1,31 @@
+"""
+Shared fixtures for the integration tests.
+
+The server module, LLM mock and Open-Meteo stub come from the
+repository-root conftest.py.
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+# Forecast returned by the mock_weather fixture
+MOCK_FORECAST = {"daily": {"temperature_2m_max": [25]}}
+
+
+@pytest.fixture(autouse=True)
+def _reset_server_state(server_module):
+    """Stop rate-limit counters and stale plans leaking between tests."""
+    server_module.limiter.reset()
+    server_module._stale_plans.clear()
+
+
+@pytest.fixture(scope="session")
+def test_client(server_module):
+    """Create one test client for the FastAPI app, shared across the session."""
+    return TestClient(server_module.app)
+
+
+@pytest.fixture
+def mock_weather(weather_stub_factory):
+    """Answer the server's Open-Meteo requests with MOCK_FORECAST."""
+    return weather_stub_factory(status=200, json=MOCK_FORECAST)
@@ -2,23 +2,7 @@
 Integration tests for affiliate link functionality in plan generation.
 """
 
-import os
-import sys
-from unittest.mock import Mock, patch
-
-import pytest
-
-# Add backend directory to path for imports
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../backend"))
-
-from fastapi.testclient import TestClient
-from server import app
-
-
-@pytest.fixture
-def test_client():
-    """Create a test client for the FastAPI app."""
-    return TestClient(app)
+import json
 
 
 class TestAffiliateLinksInPlanGeneration:
@@ -51,9 +35,8 @@ class TestAffiliateLinksInPlanGeneration:
         result_url = generate_booking_search_url("Sagrada Familia Tour", "Barcelona")
         assert result_url is None
 
-    @patch("server.LLMClient")
     def test_plan_generation_processes_affiliate_links(
-        self, mock_llm_client_class, test_client, monkeypatch
+        self, mock_llm, test_client, monkeypatch
     ):
         """Test that generated plans have valid search URLs instead of AI-hallucinated ones."""
         monkeypatch.setenv("GROQ_API_KEY", "test-key")
@@ -107,12 +90,8 @@ class TestAffiliateLinksInPlanGeneration:
             "safety_tips": ["Watch for pickpockets"]
         }"""
 
-        import json
-
-        mock_llm_instance = Mock()
-        mock_llm_instance.generate_day_plan.return_value = plan_json
-        mock_llm_instance.parse_json_response.return_value = json.loads(plan_json)
-        mock_llm_client_class.return_value = mock_llm_instance
+        mock_llm.generate_day_plan.return_value = plan_json
+        mock_llm.parse_json_response.return_value = json.loads(plan_json)
 
         # Make request to generate plan
         response = test_client.post(
@@ -1,30 +1,22 @@
 import pytest
 from unittest.mock import patch, MagicMock
-from fastapi.testclient import TestClient
-import sys
 import os
 
-sys.path.append(os.path.join(os.path.dirname(__file__), '../../backend'))
 
-from backend.server import app
-
-client = TestClient(app)
-
-
-def test_health_endpoint_is_public():
+def test_health_endpoint_is_public(test_client):
     """Health endpoint does not require X-Device-Id."""
     with patch.dict(os.environ, {"GROQ_API_KEY": "test-key"}):
-        response = client.get("/api/health")
+        response = test_client.get("/api/health")
     assert response.status_code == 200
 
 
-def test_port_search_is_public():
+def test_port_search_is_public(test_client):
     """Port search does not require authentication."""
-    response = client.get("/api/ports/search", params={"q": "Barcelona"})
+    response = test_client.get("/api/ports/search", params={"q": "Barcelona"})
     assert response.status_code == 200
 
 
-def test_generate_plan_requires_device_id():
+def test_generate_plan_requires_device_id(test_client):
     """Generate plan endpoint requires X-Device-Id header."""
     payload = {
         "trip_id": "trip-123",
@@ -44,5 +36,5 @@ def test_generate_plan_requires_device_id():
         },
     }
     # No X-Device-Id header
-    response = client.post("/api/plans/generate", json=payload)
+    response = test_client.post("/api/plans/generate", json=payload)
     assert response.status_code == 422
@@ -3,22 +3,13 @@ Integration tests for Port Search (remaining backend endpoint).
 Port CRUD within trips is now handled client-side via localStorage.
 """
 import pytest
-from fastapi.testclient import TestClient
-import sys
-import os
-
-sys.path.append(os.path.join(os.path.dirname(__file__), '../../backend'))
-
-from backend.server import app
-
-client = TestClient(app)
 
 VALID_DEVICE_ID = "test-device-123"
 
 
-def test_search_ports():
+def test_search_ports(test_client):
     """Test that port search endpoint returns results."""
-    response = client.get(
+    response = test_client.get(
         "/api/ports/search",
         params={"q": "Barcelona"},
         headers={"X-Device-Id": VALID_DEVICE_ID},
@@ -29,9 +20,9 @@ def test_search_ports():
     assert isinstance(data, list)
 
 
-def test_list_regions():
+def test_list_regions(test_client):
     """Test that regions endpoint returns a list."""
-    response = client.get("/api/ports/regions")
+    response = test_client.get("/api/ports/regions")
 
     assert response.status_code == 200
     data = response.json()
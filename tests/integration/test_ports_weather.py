@@ -4,23 +4,14 @@ Tests port search functionality and weather proxy
 """
 import pytest
 from unittest.mock import patch, AsyncMock, MagicMock
-from fastapi.testclient import TestClient
-import sys
-import os
-
-sys.path.append(os.path.join(os.path.dirname(__file__), '../../backend'))
-
-from backend.server import app
-
-client = TestClient(app)
 
 
 class TestPortSearch:
     """Tests for port search endpoints"""
     
-    def test_search_ports_no_query(self):
+    def test_search_ports_no_query(self, test_client):
         """Test searching ports with no query returns results"""
-        response = client.get("/api/ports/search")
+        response = test_client.get("/api/ports/search")
         
         assert response.status_code == 200
         results = response.json()
@@ -28,9 +19,9 @@ class TestPortSearch:
         # Should return some ports (up to limit)
         assert len(results) <= 20  # Default limit
     
-    def test_search_ports_by_name(self):
+    def test_search_ports_by_name(self, test_client):
         """Test searching ports by name"""
-        response = client.get("/api/ports/search?q=barcelona")
+        response = test_client.get("/api/ports/search?q=barcelona")
         
         assert response.status_code == 200
         results = response.json()
@@ -43,9 +34,9 @@ class TestPortSearch:
                        "barcelona" in port["country"].lower() or \
                        "barcelona" in port["region"].lower()
     
-    def test_search_ports_by_country(self):
+    def test_search_ports_by_country(self, test_client):
         """Test searching ports by country name"""
-        response = client.get("/api/ports/search?q=spain")
+        response = test_client.get("/api/ports/search?q=spain")
         
         assert response.status_code == 200
         results = response.json()
@@ -54,9 +45,9 @@ class TestPortSearch:
         if results:
             assert any("spain" in port["country"].lower() for port in results)
     
-    def test_search_ports_with_region_filter(self):
+    def test_search_ports_with_region_filter(self, test_client):
         """Test searching ports with region filter"""
-        response = client.get("/api/ports/search?region=Caribbean")
+        response = test_client.get("/api/ports/search?region=Caribbean")
         
         assert response.status_code == 200
         results = response.json()
@@ -65,31 +56,31 @@ class TestPortSearch:
         for port in results:
             assert port["region"] == "Caribbean"
     
-    def test_search_ports_with_limit(self):
+    def test_search_ports_with_limit(self, test_client):
         """Test that limit parameter works"""
-        response = client.get("/api/ports/search?limit=5")
+        response = test_client.get("/api/ports/search?limit=5")
         
         assert response.status_code == 200
         results = response.json()
         assert len(results) <= 5
     
-    def test_search_ports_max_limit_enforced(self):
+    def test_search_ports_max_limit_enforced(self, test_client):
         """Test that max limit of 500 is enforced"""
         # limit=500 is valid (used by the offline prefetch cache)
-        response = client.get("/api/ports/search?limit=500")
+        response = test_client.get("/api/ports/search?limit=500")
         assert response.status_code == 200
         results = response.json()
         assert len(results) <= 500
 
         # limit > 500 should be rejected
-        response = client.get("/api/ports/search?limit=501")
+        response = test_client.get("/api/ports/search?limit=501")
         assert response.status_code == 422
     
-    def test_search_ports_case_insensitive(self):
+    def test_search_ports_case_insensitive(self, test_client):
         """Test that search is case-insensitive"""
-        response1 = client.get("/api/ports/search?q=NASSAU")
-        response2 = client.get("/api/ports/search?q=nassau")
-        response3 = client.get("/api/ports/search?q=Nassau")
+        response1 = test_client.get("/api/ports/search?q=NASSAU")
+        response2 = test_client.get("/api/ports/search?q=nassau")
+        response3 = test_client.get("/api/ports/search?q=Nassau")
         
         assert response1.status_code == 200
         assert response2.status_code == 200
@@ -103,17 +94,17 @@ class TestPortSearch:
         if results1:  # If Nassau exists
             assert len(results1) == len(results2) == len(results3)
     
-    def test_search_ports_no_results(self):
+    def test_search_ports_no_results(self, test_client):
         """Test searching for non-existent port"""
-        response = client.get("/api/ports/search?q=nonexistentport12345")
+        response = test_client.get("/api/ports/search?q=nonexistentport12345")
         
         assert response.status_code == 200
         results = response.json()
         assert results == []
     
-    def test_list_regions(self):
+    def test_list_regions(self, test_client):
         """Test listing all port regions"""
-        response = client.get("/api/ports/regions")
+        response = test_client.get("/api/ports/regions")
         
         assert response.status_code == 200
         regions = response.json()
@@ -127,9 +118,9 @@ class TestPortSearch:
         regions_lower = [r.lower() for r in regions]
         assert any("caribbean" in r for r in regions_lower)
     
-    def test_search_ports_combined_filters(self):
+    def test_search_ports_combined_filters(self, test_client):
         """Test combining query and region filter"""
-        response = client.get("/api/ports/search?q=nassau&region=Caribbean")
+        response = test_client.get("/api/ports/search?q=nassau&region=Caribbean")
         
         assert response.status_code == 200
         results = response.json()
@@ -144,7 +135,7 @@ class TestWeatherAPI:
     """Tests for weather API proxy"""
     
     @patch('httpx.AsyncClient')
-    def test_get_weather_success(self, mock_httpx):
+    def test_get_weather_success(self, mock_httpx, test_client):
         """Test successful weather data retrieval"""
         # Mock httpx response
         mock_response = MagicMock()
@@ -163,27 +154,27 @@ class TestWeatherAPI:
         mock_client.__aenter__.return_value.get = AsyncMock(return_value=mock_response)
         mock_httpx.return_value = mock_client
         
-        response = client.get("/api/weather?latitude=41.38&longitude=2.19")
+        response = test_client.get("/api/weather?latitude=41.38&longitude=2.19")
         
         assert response.status_code == 200
         data = response.json()
         assert "daily" in data
     
-    def test_get_weather_missing_coordinates(self):
+    def test_get_weather_missing_coordinates(self, test_client):
         """Test weather endpoint with missing coordinates"""
-        response = client.get("/api/weather")
+        response = test_client.get("/api/weather")
         
         # Should return 422 for missing required params
         assert response.status_code == 422
     
-    def test_get_weather_invalid_latitude(self):
+    def test_get_weather_invalid_latitude(self, test_client):
         """Test weather endpoint with invalid latitude"""
-        response = client.get("/api/weather?latitude=invalid&longitude=2.19")
+        response = test_client.get("/api/weather?latitude=invalid&longitude=2.19")
         
         assert response.status_code == 422
     
     @patch('httpx.AsyncClient')
-    def test_get_weather_with_date(self, mock_httpx):
+    def test_get_weather_with_date(self, mock_httpx, test_client):
         """Test weather retrieval with specific date"""
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -193,14 +184,14 @@ class TestWeatherAPI:
         mock_client.__aenter__.return_value.get = AsyncMock(return_value=mock_response)
         mock_httpx.return_value = mock_client
         
-        response = client.get(
+        response = test_client.get(
             "/api/weather?latitude=41.38&longitude=2.19&date=2023-10-01"
         )
         
         assert response.status_code == 200
     
     @patch('httpx.AsyncClient')
-    def test_get_weather_api_error(self, mock_httpx):
+    def test_get_weather_api_error(self, mock_httpx, test_client):
         """Test handling of weather API errors"""
         mock_response = MagicMock()
         mock_response.status_code = 500
@@ -209,7 +200,7 @@ class TestWeatherAPI:
         mock_client.__aenter__.return_value.get = AsyncMock(return_value=mock_response)
         mock_httpx.return_value = mock_client
         
-        response = client.get("/api/weather?latitude=41.38&longitude=2.19")
+        response = test_client.get("/api/weather?latitude=41.38&longitude=2.19")
         
         # Should return 502 Bad Gateway when weather service fails
         assert response.status_code == 502
@@ -219,7 +210,7 @@ class TestWeatherAPI:
         assert "unavailable" in detail["message"].lower()
     
     @patch('httpx.AsyncClient')
-    def test_get_weather_extreme_coordinates(self, mock_httpx):
+    def test_get_weather_extreme_coordinates(self, mock_httpx, test_client):
         """Test weather with extreme but valid coordinates"""
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -230,17 +221,17 @@ class TestWeatherAPI:
         mock_httpx.return_value = mock_client
         
         # Test near poles
-        response = client.get("/api/weather?latitude=89.9&longitude=0")
+        response = test_client.get("/api/weather?latitude=89.9&longitude=0")
         assert response.status_code in [200, 502]
         
         # Test near dateline
-        response = client.get("/api/weather?latitude=0&longitude=179.9")
+        response = test_client.get("/api/weather?latitude=0&longitude=179.9")
         assert response.status_code in [200, 502]
 
 
-def test_health_endpoint():
+def test_health_endpoint(test_client):
     """Test health check endpoint"""
-    response = client.get("/api/health")
+    response = test_client.get("/api/health")
     
     assert response.status_code == 200
     data = response.json()
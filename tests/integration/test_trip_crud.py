@@ -4,20 +4,11 @@ Trip/plan CRUD is now handled client-side via localStorage.
 These tests verify the AI plan generation endpoint accepts port details directly.
 """
 import pytest
-from fastapi.testclient import TestClient
-import sys
-import os
-
-sys.path.append(os.path.join(os.path.dirname(__file__), '../../backend'))
-
-from backend.server import app
-
-client = TestClient(app)
 
 VALID_DEVICE_ID = "test-device-123"
 
 
-def test_generate_plan_requires_port_details():
+def test_generate_plan_requires_port_details(test_client):
     """Test that generate-plan requires port details in request body."""
     # Missing port_name, port_country, latitude, longitude, arrival, departure
     payload = {
@@ -31,7 +22,7 @@ def test_generate_plan_requires_port_details():
         },
     }
 
-    response = client.post(
+    response = test_client.post(
         "/api/plans/generate",
         json=payload,
         headers={"X-Device-Id": VALID_DEVICE_ID},
@@ -92,6 +92,33 @@ class TestAddAffiliateParams:
         assert "adults=2" in result
         assert "aid=test-viator-789" in result
 
+    def test_existing_query_preserved_verbatim(self, monkeypatch):
+        """Test the existing query is kept as-is and existing params not overridden."""
+        monkeypatch.setenv("VIATOR_AFFILIATE_ID", "test-viator-789")
+        url = "https://www.viator.com/tours/Rome/tour/123?tag=a&tag=b&mcid=other"
+        result = add_affiliate_params(url)
+
+        assert result == url + "&aid=test-viator-789"
+
+    def test_fragment_kept_after_params(self, monkeypatch):
+        """Test affiliate params are inserted before the URL fragment."""
+        monkeypatch.setenv("VIATOR_AFFILIATE_ID", "test-viator-789")
+        url = "https://www.viator.com/tours/Rome/tour/123#reviews"
+        result = add_affiliate_params(url)
+
+        assert result == (
+            "https://www.viator.com/tours/Rome/tour/123"
+            "?aid=test-viator-789&mcid=cruise-planner-app#reviews"
+        )
+
+    def test_affiliate_id_is_url_encoded(self, monkeypatch):
+        """Test affiliate IDs with reserved characters are percent-encoded."""
+        monkeypatch.setenv("VIATOR_AFFILIATE_ID", "id with&space")
+        url = "https://www.viator.com/tours/Rome/tour/123"
+        result = add_affiliate_params(url)
+
+        assert "aid=id+with%26space" in result
+
     def test_empty_url(self):
         """Test empty URL is handled gracefully."""
         assert add_affiliate_params("") == ""
@@ -269,6 +296,21 @@ class TestProcessPlanActivities:
         # Result should have affiliate params added (URL is valid)
         assert "aid=test-456" in result[0]["booking_url"]
 
+    def test_only_changed_activities_are_copied(self, monkeypatch):
+        """Test unchanged activities are passed through and changed ones copied."""
+        monkeypatch.setenv("VIATOR_AFFILIATE_ID", "test-456")
+
+        activities = [
+            {"order": 1, "name": "Tour", "booking_url": None},
+            {"order": 2, "booking_url": None},
+        ]
+
+        result = process_plan_activities(activities, port_name="Rome")
+
+        assert result[0] is not activities[0]
+        assert activities[0]["booking_url"] is None
+        assert result[1] is activities[1]
+
 
 class TestAffiliateConfig:
     """Test affiliate configuration retrieval."""
@@ -296,6 +338,18 @@ class TestAffiliateConfig:
         config = get_affiliate_config("unknown.com")
         assert config is None
 
+    def test_subdomain_matches_partner(self, monkeypatch):
+        """Test subdomains of a partner domain get the partner's configuration."""
+        monkeypatch.setenv("BOOKING_AFFILIATE_ID", "test-789")
+        config = get_affiliate_config("secure.booking.com")
+
+        assert config == {"aid": "test-789", "label": "cruise-planner-booking"}
+
+    def test_lookalike_domains_rejected(self):
+        """Test domains that merely contain a partner domain return None."""
+        assert get_affiliate_config("notviator.com") is None
+        assert get_affiliate_config("viator.com.evil.com") is None
+
 
 class TestGetConfiguredPlatforms:
     """Test discovery of configured affiliate platforms."""
@@ -6,11 +6,6 @@ from unittest.mock import MagicMock, patch
 
 import pytest
 
-# Add backend to path
-import sys
-
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../backend"))
-
 from llm_client import (
     LLMAPIError,
     LLMAuthenticationError,
@@ -1,12 +1,7 @@
-import sys
-import os
 import pytest
 from datetime import datetime, timedelta
 from pydantic import ValidationError
 
-# Add backend directory to path for imports
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../backend"))
-
 from server import TripInput, PlanPreferences, GeneratePlanInput, PortInput
 
 def test_trip_input_valid():
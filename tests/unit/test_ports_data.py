@@ -2,13 +2,8 @@
 Unit tests for ports_data.py module
 Tests the cruise ports database integrity and structure
 """
-import sys
-import os
 import pytest
 
-# Add backend directory to path for imports
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../backend"))
-
 from ports_data import CRUISE_PORTS
 
 